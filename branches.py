@@ -11,7 +11,7 @@ from typing import Any, ClassVar, Generic, override, TextIO, TYPE_CHECKING, \
   TypeVar
 
 import log
-from macros import AppendTextCallback
+from macros import AppendTextCallback, StandardMacroT
 
 if TYPE_CHECKING:
   from execution import ExecutionContext as _ExecutionContextT
@@ -31,6 +31,8 @@ class Branch(ABC, Generic[_SubBranchT]):
   """
 
   type_name: ClassVar[str]  # as returned by $branch.type
+  # The $branch.type macro callback, shared by all branches of the class.
+  _branch_type_callback: ClassVar[StandardMacroT]
   parent: Branch[Any] | None  # None if root
   root: Branch[Any]  # self if the branch is root
   context: _ExecutionContextT
@@ -43,6 +45,11 @@ class Branch(ABC, Generic[_SubBranchT]):
   #  The output writer of the root branch. None for child branches.
   writer: TextIO | None
 
+  def __init_subclass__(cls, **kwargs: Any) -> None:
+    super().__init_subclass__(**kwargs)
+    if 'type_name' in cls.__dict__:
+      cls._branch_type_callback = AppendTextCallback(cls.type_name)
+
   def __init__(self, *, parent: Branch[Any] | None,
                parent_context: _ExecutionContextT | None=None,
                name: str | None=None, writer: TextIO | None=None):
@@ -64,7 +71,7 @@ class Branch(ABC, Generic[_SubBranchT]):
     self.sub_branches = []
     self.attached = not parent
 
-    self.context.AddMacro('branch.type', AppendTextCallback(self.type_name))
+    self.context.AddMacro('branch.type', type(self)._branch_type_callback)
 
     if parent:
       parent.sub_branches.append(self)
@@ -4,7 +4,7 @@ from __future__ import annotations
 
 __author__ = 'Guillaume Ryder'
 
-from collections.abc import Mapping
+from collections.abc import Callable, Mapping
 import io
 import os
 import pathlib
@@ -18,7 +18,7 @@ from log import NodeError
 import macros
 from macros import MacrosT, StandardMacroT
 import parsing
-from parsing import CallNode, NodesT
+from parsing import CallNode, NodeKind, NodesT, TextNode
 
 
 ENCODING = 'utf-8'
@@ -66,18 +66,14 @@ class ExecutionContext:
     for name, callback in macros.items():
       self.AddMacro(name, callback)
 
-  def LookupMacro(self, name: str, text_compatible: bool) -> (
-      StandardMacroT | None):
+  def LookupMacroAny(self, name: str) -> StandardMacroT | None:
     """Finds the macro with the given name in this context.
 
     If several macros have the same name, gives the priority to the macro
     defined in the deeper call stack entry.
 
-    If the macro must be text-compatible, skips text-incompatible matches.
-
     Args:
       name: The name of the macro to find.
-      text_compatible: Whether the macro must be text-compatible.
 
     Returns:
       The macro callback, None if no macro has been found.
@@ -88,11 +84,33 @@ class ExecutionContext:
     context: ExecutionContext | None = self
     while context:
       callback = context.macros.get(name)
-      if callback and (not text_compatible or callback.text_compatible):
+      if callback is not None:
         return callback
       context = context.parent
     return None
 
+  def LookupMacroTextCompatible(self, name: str) -> (
+      tuple[StandardMacroT | None, bool]):
+    """Same as LookupMacroAny, but skips text-incompatible macros.
+
+    Args:
+      name: The name of the macro to find.
+
+    Returns:
+      The macro callback, None if no macro has been found; and whether
+      text-incompatible matches have been skipped.
+    """
+    skipped_text_incompatible = False
+    context: ExecutionContext | None = self
+    while context:
+      callback = context.macros.get(name)
+      if callback is not None:
+        if callback.text_compatible:
+          return callback, skipped_text_incompatible
+        skipped_text_incompatible = True
+      context = context.parent
+    return None, skipped_text_incompatible
+
 
 PathLikeT = str | os.PathLike[str]
 
@@ -138,6 +156,15 @@ class FileSystem:
     return cls.Path(os.path.normpath(cur_dir / path))
 
 
+def _AddDefaultExt(abs_path: PurePath, *, default_ext: str | None,
+                   fs: FileSystem) -> PurePath:
+  """Appends default_ext to abs_path if it has no suffix and does not exist."""
+  if (default_ext is not None and not abs_path.suffix and
+      not fs.lexists(abs_path)):
+    abs_path = abs_path.with_suffix(default_ext)
+  return abs_path
+
+
 class Executor:
   """Executes input files.
 
@@ -148,6 +175,7 @@ class Executor:
 
   logger: log.Logger
   fs: FileSystem
+  __fs_open: Callable[..., TextIO]  # fs.open, bound once.
   __current_dir: PurePath  # The absolute path of the current directory.
 
   # The absolute path prefix of all output files; treated as a string prefix,
@@ -171,9 +199,14 @@ class Executor:
   __current_text_writer: TextIO | None
 
   # The current macro call stack, pre-allocated to MAX_NESTED_CALLS frames.
-  __call_stack: list[tuple[CallNode, StandardMacroT] | None]
+  __call_stack: list[CallNode | None]
   __call_stack_size: int  # The number of frames in __call_stack.
-  __include_stack: list[log.Filename]  # The stack of included file names.
+  __include_depth: int  # The number of files being executed.
+  # The results of MakeAbsolute in ResolveFilePath, keyed by (path, directory).
+  __abs_paths_cache: dict[tuple[str, PathLikeT], PurePath]
+
+  # The ExecuteNodes handlers indexed by Node.kind, bound once per executor.
+  __node_handlers: tuple[Callable[[Any], None], ...]
 
   def __init__(self, *, logger: log.Logger, fs: FileSystem=FileSystem(),
                current_dir: PurePath, output_path_prefix: PurePath):
@@ -181,6 +214,7 @@ class Executor:
     assert output_path_prefix.is_absolute(), str(output_path_prefix)
     self.logger = logger
     self.fs = fs
+    self.__fs_open = fs.open
     self.__current_dir = current_dir
     self.__output_path_prefix = output_path_prefix
     self.opened_paths = set()
@@ -192,7 +226,13 @@ class Executor:
     self.__current_text_writer = None
     self.__call_stack = [None] * MAX_NESTED_CALLS
     self.__call_stack_size = 0
-    self.__include_stack = []
+    self.__include_depth = 0
+    self.__abs_paths_cache = {}
+    handlers_by_kind: dict[NodeKind, Callable[[Any], None]] = {
+        NodeKind.TEXT: self.__AppendTextNode,
+        NodeKind.CALL: self.CallMacro,
+    }
+    self.__node_handlers = tuple(handlers_by_kind[kind] for kind in NodeKind)
     self.RegisterBranch(self.system_branch)
     for macros_container in macros.GetPublicMacrosContainers():
       self.system_branch.context.AddMacros(
@@ -236,7 +276,7 @@ class Executor:
 
     # Create the writer.
     try:
-      writer = fs.open(path, mode='wt')
+      writer = self.__fs_open(path, mode='wt')
     except OSError as e:
       raise NodeError(f'unable to write to file: {path}\n{e}') from e
     self.opened_paths.add(path)
@@ -256,11 +296,13 @@ class Executor:
     Returns:
       The resolved path, always absolute.
     """
-    return self.ResolveFilePathStatic(
-        path,
-        abs_directory=self.__current_dir / directory,
-        default_ext=default_ext,
-        fs=self.fs)
+    # Cache the absolute path: the same files are often included repeatedly.
+    cache_key = (path, directory)
+    abs_path = self.__abs_paths_cache.get(cache_key)
+    if abs_path is None:
+      abs_path = self.fs.MakeAbsolute(self.__current_dir / directory, path)
+      self.__abs_paths_cache[cache_key] = abs_path
+    return _AddDefaultExt(abs_path, default_ext=default_ext, fs=self.fs)
 
   @staticmethod
   def ResolveFilePathStatic(path: str, *,
@@ -280,11 +322,8 @@ class Executor:
       The resolved path, always absolute.
     """
     assert abs_directory.is_absolute()
-    abs_path = fs.MakeAbsolute(abs_directory, path)
-    if (default_ext is not None and not abs_path.suffix and
-        not fs.lexists(abs_path)):
-      abs_path = abs_path.with_suffix(default_ext)
-    return abs_path
+    return _AddDefaultExt(fs.MakeAbsolute(abs_directory, path),
+                          default_ext=default_ext, fs=fs)
 
   def ExecuteFile(self, path: PurePath) -> None:
     """Executes the given PyScribe file.
@@ -300,16 +339,17 @@ class Executor:
     assert path.is_absolute()
     self.opened_paths.add(path)
     filename = log.Filename(path, path.parent)
-    with self.fs.open(path, mode='rt') as reader:
-      if len(self.__include_stack) >= MAX_NESTED_INCLUDES:
+    with self.__fs_open(path, mode='rt') as reader:
+      include_depth_orig = self.__include_depth
+      if include_depth_orig >= MAX_NESTED_INCLUDES:
         raise NodeError('too many nested includes')
 
-      self.__include_stack.append(filename)
+      self.__include_depth = include_depth_orig + 1
       try:
         nodes = parsing.ParseFile(reader, filename, logger=self.logger)
         self.ExecuteNodes(nodes)
       finally:
-        self.__include_stack.pop()
+        self.__include_depth = include_depth_orig
 
   def RenderBranches(self) -> None:
     """Renders all root branches with an output file.
@@ -334,12 +374,16 @@ class Executor:
     Raises:
       FatalError
     """
+    handlers = self.__node_handlers
     for node in nodes:
       try:
-        node.Execute(self)
+        handlers[node.kind](node)
       except NodeError as e:
         raise self.FatalError(node.location, e) from e
 
+  def __AppendTextNode(self, node: TextNode) -> None:
+    self.AppendText(node.text)
+
   def ExecuteInCallContext(
       self, nodes: NodesT, call_context: ExecutionContext | None) -> None:
     """Executes the given nodes in the given call context.
@@ -411,6 +455,15 @@ class Executor:
     Raises:
       FatalError
     """
+    # Fast path: plain text nodes evaluate to their own text.
+    texts = []
+    for node in nodes:
+      if not isinstance(node, TextNode):
+        break
+      texts.append(node.text)
+    else:
+      return ''.join(texts)
+
     with io.StringIO() as text_writer:
       old_text_writer = self.__current_text_writer
       self.__current_text_writer = text_writer
@@ -424,9 +477,8 @@ class Executor:
                  call_frame_skip: int=0) -> log.FatalError:
     """Logs and raises a fatal error."""
     frame_count = max(0, self.__call_stack_size - call_frame_skip)
-    call_stack: list[tuple[CallNode, StandardMacroT]] = (
-        self.__call_stack[:frame_count])  # type: ignore[assignment]
-    call_nodes = [call_node for call_node, callback in reversed(call_stack)]
+    call_nodes: list[CallNode] = list(reversed(
+        self.__call_stack[:frame_count]))  # type: ignore[arg-type]
     return self.logger.LocationError(location, message, call_stack=call_nodes)
 
   def MacroFatalError(self, call_node: CallNode, message: log.MessageT, *,
@@ -452,36 +504,52 @@ class Executor:
     Returns:
       The macro callback, None if no macro has been found.
     """
+    if text_compatible:
+      return self.__LookupMacroTextCompatible(name)[0]
     for context in (self.call_context, self.current_branch.context):
-      callback = context.LookupMacro(name, text_compatible)
+      callback = context.LookupMacroAny(name)
       if callback is not None:
         return callback
     return None
 
+  def __LookupMacroTextCompatible(self, name: str) -> (
+      tuple[StandardMacroT | None, bool]):
+    """Same as LookupMacro(text_compatible=True), also returns whether
+    text-incompatible matches have been skipped."""
+    skipped_text_incompatible = False
+    for context in (self.call_context, self.current_branch.context):
+      callback, skipped = context.LookupMacroTextCompatible(name)
+      if callback is not None:
+        return callback, skipped_text_incompatible
+      skipped_text_incompatible |= skipped
+    return None, skipped_text_incompatible
+
   def CallMacro(self, call_node: CallNode) -> None:
     """Invokes a macro.
 
     Args:
       call_node: The macro call description.
     """
-    text_compatible = (self.__current_text_writer is not None)
-    callback = self.LookupMacro(call_node.name, text_compatible=text_compatible)
+    if self.__current_text_writer is None:
+      callback = self.LookupMacro(call_node.name, text_compatible=False)
+      skipped_text_incompatible = False
+    else:
+      callback, skipped_text_incompatible = (
+          self.__LookupMacroTextCompatible(call_node.name))
     if callback is None:
       # Macro not found
-      if text_compatible:
+      if skipped_text_incompatible:
         # Show a specific error message if the macro is not found
         # because text-incompatible.
-        callback = self.LookupMacro(call_node.name, text_compatible=False)
-        if callback is not None:
-          raise self.MacroFatalError(call_node, 'text-incompatible macro call',
-                                     call_frame_skip=0)
+        raise self.MacroFatalError(call_node, 'text-incompatible macro call',
+                                   call_frame_skip=0)
       raise self.FatalError(call_node.location,
                             f'macro not found: ${call_node.name}')
 
     # Store the new call stack frame. Enforce the call stack size limit.
     call_stack_size_orig = self.__call_stack_size
     try:
-      self.__call_stack[call_stack_size_orig] = (call_node, callback)
+      self.__call_stack[call_stack_size_orig] = call_node
       self.__call_stack_size = call_stack_size_orig + 1
     except IndexError as e:
       raise self.MacroFatalError(call_node, 'too many nested macro calls',
@@ -10,7 +10,7 @@ import branch_macros
 import execution
 import log
 from macros import macro
-from parsing import CallNode
+from parsing import CallNode, TextNode
 import testutils
 
 
@@ -52,6 +52,16 @@ class ExecutorTest(testutils.TestCase):
         self.executor.ResolveFilePath('../sibling/file', 'dir/sub'),
         self.fs.Path('/cur/dir/sibling/file'))
 
+  def testResolveFilePath_cached(self):
+    for _ in range(2):
+      self.assertEqual(self.executor.ResolveFilePath('file', '/cur/one'),
+                       self.fs.Path('/cur/one/file'))
+      self.assertEqual(self.executor.ResolveFilePath('file', '/cur/two'),
+                       self.fs.Path('/cur/two/file'))
+      self.assertEqual(
+          self.executor.ResolveFilePath('file', '/cur/one', default_ext='.e'),
+          self.fs.Path('/cur/one/file.e'))
+
   def testResolveFilePath_noDefaultExt(self):
     self.assertEqual(
         self.executor.ResolveFilePath('/file', '/cur', default_ext=None),
@@ -111,6 +121,15 @@ class ExecutorTest(testutils.TestCase):
     self.assertEqual(branch1.name, 'auto1')
     self.assertEqual(branch2.name, 'auto2')
 
+  def testRegisterBranch_namedThenUnnamed(self):
+    branch_named = TextBranch(parent=None, name='auto1')
+    self.executor.RegisterBranch(branch_named)
+    branch_unnamed = TextBranch(parent=None)
+    self.executor.RegisterBranch(branch_unnamed)
+    self.assertEqual(branch_unnamed.name, 'auto2')
+    self.assertEqual(self.executor.branches.get('auto1'), branch_named)
+    self.assertEqual(self.executor.branches.get('auto2'), branch_unnamed)
+
   def testRegisterBranch_root(self):
     branch = TextBranch(parent=None)
     self.executor.RegisterBranch(branch)
@@ -134,6 +153,13 @@ class ExecutorTest(testutils.TestCase):
     self.assertEqual(branch_child.name, 'auto2')
     self.assertEqual(branch_grand_child.name, 'auto3')
 
+  def testEvalText_textOnly(self):
+    loc = testutils.TEST_LOCATION
+    self.assertEqual(self.executor.EvalText([]), '')
+    self.assertEqual(
+        self.executor.EvalText([TextNode(loc, 'one '), TextNode(loc, 'two')]),
+        'one two')
+
   def CheckArgumentCount(self, min_args_count, max_args_count,
                          actual_args_count):
     call_node = CallNode(testutils.TEST_LOCATION, 'name',
@@ -7,6 +7,7 @@ __author__ = 'Guillaume Ryder'
 
 from collections.abc import Callable
 from abc import ABC, abstractmethod
+import codecs
 import enum
 import re
 from typing import Any, ClassVar, override, TextIO
@@ -37,11 +38,9 @@ _DELETE_IF_EMPTY_ATTR_VALUE = '1'
 
 # Tags that have no contents therefore render as <tag/>.
 # Source: http://www.w3.org/TR/html-markup/syntax.html#void-element
-_VOID_TAGS_TO_NONE = {
-  tag: None
-  for tag in 'area,base,br,col,command,embed,hr,img,input,keygen,link,meta,'
-             'param,source,track,wbr'.split(',')
-}
+_VOID_TAGS = frozenset(
+    'area,base,br,col,command,embed,hr,img,input,keygen,link,meta,'
+    'param,source,track,wbr'.split(','))
 
 # Characters to strip around tag text contents.
 _STRIPPABLE = ' \r\n\t'
@@ -52,7 +51,12 @@ def GetTagEmptyContents(tag_name: str) -> str | None:
 
   Returns None or '' depending on the tag.
   """
-  return _VOID_TAGS_TO_NONE.get(tag_name, '')
+  return None if tag_name in _VOID_TAGS else ''
+
+
+def _MarkDeleteIfEmpty(elem: _Element) -> None:
+  """Marks an element for deletion at rendering time if it is empty."""
+  elem.set(_DELETE_IF_EMPTY_ATTR_NAME, _DELETE_IF_EMPTY_ATTR_VALUE)
 
 
 @enum.unique
@@ -99,19 +103,24 @@ class HtmlBranch(Branch['HtmlBranch']):
     """
     parent: The ElementInfo of the parent of the element.
     elem: The element.
+    tag: The tag of the element; cached since lxml creates a new string for
+      each elem.tag access.
     level: The level of the element.
     auto_para_tag: The tag to use for auto-paragraphs,
       None if the element does not support auto-paragraphs.
       Must be None for non-block elements.
     """
+    __slots__ = ('parent', 'elem', 'tag', 'level', 'auto_para_tag')
+
     def __init__(self, parent: HtmlBranch.ElementInfo | None,
                  elem: _Element, level: TagLevel,
                  auto_para_tag: str | None=None):
       if auto_para_tag:
-        assert level == TagLevel.BLOCK
-        assert auto_para_tag not in _VOID_TAGS_TO_NONE
+        assert level is TagLevel.BLOCK
+        assert auto_para_tag not in _VOID_TAGS
       self.parent = parent
       self.elem = elem
+      self.tag = elem.tag
       self.level = level
       self.auto_para_tag = auto_para_tag
 
@@ -135,6 +144,10 @@ class HtmlBranch(Branch['HtmlBranch']):
   # If None, inherits the typography of the parent branch.
   __typography: Typography | None
 
+  # The typography of the branch, resolved from its ancestors if needed.
+  # None if not resolved yet. Reset by SetTypography.
+  __typography_resolved: Typography | None
+
   #  The context containing the macros of self.typography.
   __typography_context: ExecutionContext
 
@@ -178,6 +191,7 @@ class HtmlBranch(Branch['HtmlBranch']):
     self.context = context
 
     # Set a typography for root branches.
+    self.__typography_resolved = None
     self.typography = TYPOGRAPHIES['neutral'] if parent is None else None
 
     if parent is None:
@@ -208,41 +222,61 @@ class HtmlBranch(Branch['HtmlBranch']):
     self.AutoParaTryOpen()
 
   def GetTypography(self) -> Typography:
-    branch = self
-    while branch is not None:
-      typography = branch.__typography
-      if typography:
-        return typography
-      branch = branch.parent  # type: ignore[assignment]
-    return None  # pragma: no cover
+    typography = self.__typography_resolved
+    if typography is None:
+      typography = self.__ResolveTypography()
+      self.__typography_resolved = typography
+    return typography
 
   def SetTypography(self, typography: Typography) -> None:
     self.__typography = typography
+    self.__ResetResolvedTypography()
     self.__typography_context.macros = (
         typography.context.macros if typography else {})
 
   typography = property(GetTypography, SetTypography,
                         doc='(Typography) The typography rules.')
 
+  def __ResolveTypography(self) -> Typography:
+    """Returns the typography of the closest branch having one, from self up."""
+    branch = self
+    while branch is not None:
+      typography = branch.__typography
+      if typography:
+        return typography
+      branch = branch.parent  # type: ignore[assignment]
+    return None  # pragma: no cover
+
+  def __ResetResolvedTypography(self) -> None:
+    """Resets the resolved typography of the branch and its sub-branches."""
+    self.__typography_resolved = None
+    for sub_branch in self.sub_branches:
+      sub_branch.__ResetResolvedTypography()
+
   def AppendRawText(self, text: str) -> None:
     """Appends plain text.
 
     Ignores typography and paragraph detection.
     """
-    self.__text_accu.append(self.__text_sep)
-    self.__text_accu.append(text)
+    accu_append = self.__text_accu.append
+    accu_append(self.__text_sep)
+    accu_append(text)
     self.__line_tail = self.__text_sep = ''
 
   @override
   def AppendText(self, text: str) -> None:
+    # Fast path: most chunks of text contain no paragraph break.
+    if '\n\n' not in text:
+      if text:
+        self.AppendLineText(text)
+      return
+
     paras = self.__AUTO_PARA_DELIMITER.split(text)
 
     # Write the tail of the previous paragraph.
     first_para = paras[0]
     if first_para:
       self.AppendLineText(first_para)
-    if len(paras) == 1:
-      return
 
     # Flush then write the paragraphs without the buffer.
     for para in paras[1:]:
@@ -254,7 +288,6 @@ class HtmlBranch(Branch['HtmlBranch']):
         self.AppendLineText(para)
 
   __NBSP_TRIM_REGEXP = re.compile(r' *(' + '|'.join(SP_ALL) + r') *')
-  __MULTIPLE_SPACES = re.compile(r' {2,}')
 
   def AppendLineText(self, text: str) -> None:
     """Appends text to the current line.
@@ -264,8 +297,15 @@ class HtmlBranch(Branch['HtmlBranch']):
     Args:
       text: The non-empty string to append. Must not contain any '\n'.
     """
-    text = self.__NBSP_TRIM_REGEXP.sub(r'\1', text)
-    text = self.__MULTIPLE_SPACES.sub(' ', text)
+    # Skip the substitutions when they are noops: most text chunks have no
+    # special space and no consecutive spaces.
+    if ' ' in text:
+      if any(space in text for space in SP_ALL):
+        text = self.__NBSP_TRIM_REGEXP.sub(r'\1', text)
+      # Collapse runs of spaces. Each iteration halves the runs; faster than
+      # a regexp substitution since most runs are 2-3 spaces long.
+      while '  ' in text:
+        text = text.replace('  ', ' ')
     assert text
 
     sep = self.__text_sep
@@ -353,7 +393,7 @@ class HtmlBranch(Branch['HtmlBranch']):
     Returns:
       Whether a tag was closed.
     """
-    if self.__current_elem_info.level == TagLevel.AUTO_PARAGRAPH:
+    if self.__current_elem_info.level is TagLevel.AUTO_PARAGRAPH:
       self.__CloseCurrentElement(discard_if_empty=True)
       return True
     else:
@@ -368,13 +408,18 @@ class HtmlBranch(Branch['HtmlBranch']):
     if text_accu:
       text = ''.join(text_accu)
       del self.__text_accu[:]
-      elem = self.__current_elem
-      if len(elem):
-        # Append to the tail of the last child of the current element.
-        self._AppendTextToXml(text, tail_elem=elem[-1])
-      else:
-        # Append to the text of the current, childless element.
-        self._AppendTextToXml(text, text_elem=elem)
+      # Inlined equivalent of _AppendTextToXml.
+      if text:
+        elem = self.__current_elem
+        if len(elem):
+          # Append to the tail of the last child of the current element.
+          tail_elem = elem[-1]
+          tail = tail_elem.tail
+          tail_elem.tail = tail + text if tail else text
+        else:
+          # Append to the text of the current, childless element.
+          elem_text = elem.text
+          elem.text = elem_text + text if elem_text else text
       self.__line_tail = text
     self.__text_sep = ''
 
@@ -430,7 +475,7 @@ class HtmlBranch(Branch['HtmlBranch']):
       NodeError: The given tag cannot be found or closed.
     """
     while True:
-      if self.__current_elem.tag == tag:
+      if self.__current_elem_info.tag == tag:
         # Tag match: close the element, open a new paragraph if appropriate.
         self.__CloseCurrentElement(discard_if_empty=False)
         self.AutoParaTryOpen(except_tag=tag)
@@ -440,7 +485,7 @@ class HtmlBranch(Branch['HtmlBranch']):
         # Not a pragraph: tag mismatch error.
         raise NodeError(
             f'expected current tag to be <{tag}>, '
-            f'got <{self.__current_elem.tag}>')
+            f'got <{self.__current_elem_info.tag}>')
 
   def __CloseCurrentElement(self, *, discard_if_empty: bool) -> None:
     """Closes the current element.
@@ -492,15 +537,8 @@ class HtmlBranch(Branch['HtmlBranch']):
     """
     # pylint: disable=unnecessary-lambda-assignment
     elem_info_predicate: Callable[[HtmlBranch.ElementInfo], bool]
-    if target == 'current':
-      # Current element, possibly automatically created.
-      elem_info_predicate = lambda elem_info: True
-    elif target == 'auto':
-      # Current automatically created element, fails if none.
-      elem_info_predicate = lambda elem_info: elem_info.level.is_auto
-    elif target == 'nonauto':
-      # First non-automatically created ancestor element.
-      elem_info_predicate = lambda elem_info: not elem_info.level.is_auto
+    if target in _STATIC_TARGET_PREDICATES:
+      elem_info_predicate = _STATIC_TARGET_PREDICATES[target]
     elif target == 'parent':
       # Parent element.
       elem_info_predicate = (
@@ -515,16 +553,13 @@ class HtmlBranch(Branch['HtmlBranch']):
           return
         elem_info = elem_info.parent
       raise NodeError('no previous element exists')
-    elif target == 'para':
-      # Deepest paragraph element.
-      elem_info_predicate = lambda elem_info: elem_info.level.is_para
     else:
       # Deepest element with the given tag.
       tag_match = self.__TAG_TARGET_REGEXP.match(target)
       if tag_match is None:
         raise NodeError(f'invalid target: {target}')
       tag = tag_match.group(1)
-      elem_info_predicate = lambda elem_info: elem_info.elem.tag == tag
+      elem_info_predicate = lambda elem_info: elem_info.tag == tag
 
     # Execute the action against the deepest element matching the predicate.
     elem_info = self.__current_elem_info
@@ -551,7 +586,7 @@ class HtmlBranch(Branch['HtmlBranch']):
 
     # Post-process all elements.
     assert self.__tree
-    self.__PostProcessElementsRecurse(self.__tree.getroot())
+    self.__PostProcessElements(self.__tree.getroot())
 
     # Insert line breaks in <body>.
     body_elem = self.__root_elem
@@ -560,7 +595,7 @@ class HtmlBranch(Branch['HtmlBranch']):
     body_elem.tail = '\n'
 
     writer.write(self.__XML_HEADER)
-    writer.write(etree.tostring(self.__tree, encoding=str))
+    _WriteXmlTree(self.__tree, writer)
     writer.write('\n')
 
   def __Finalize(self) -> None:
@@ -578,7 +613,7 @@ class HtmlBranch(Branch['HtmlBranch']):
     if self.__current_elem_info.parent:
       raise NodeError(
           f'element not closed in branch "{self.name}": '
-          f'<{self.__current_elem.tag}>')
+          f'<{self.__current_elem_info.tag}>')
 
     # Inline the attached branches.
     for branch in self.sub_branches:
@@ -587,20 +622,32 @@ class HtmlBranch(Branch['HtmlBranch']):
         self._InlineXmlElement(branch.__root_elem)
 
   @classmethod
-  def __PostProcessElementsRecurse(
-      cls, elem: _Element, *, strip_spaces: bool=False) -> None:
-    """Finalizes an element: strips spaces, processes "delete if empty".
+  def __PostProcessElements(cls, root_elem: _Element) -> None:
+    """Finalizes an element and its descendants, see __PostProcessElement.
 
-    Strips spaces on <body> children only.
+    Strips spaces on <body> descendants only.
 
-    Recurses in children.
+    Processes children before their parent, in document order.
+    Walks the tree iteratively to support arbitrarily deep trees.
     """
-    # Recurse.
-    strip_spaces_child = strip_spaces or elem.tag == 'body'
-    for child_elem in list(elem):
-      cls.__PostProcessElementsRecurse(child_elem,
-                                       strip_spaces=strip_spaces_child)
+    # Stack of (element, strip_spaces, children_pushed) tuples.
+    stack: list[tuple[_Element, bool, bool]] = [(root_elem, False, False)]
+    while stack:
+      elem, strip_spaces, children_pushed = stack.pop()
+      if children_pushed:
+        cls.__PostProcessElement(elem, strip_spaces=strip_spaces)
+      else:
+        stack.append((elem, strip_spaces, True))
+        strip_spaces_child = strip_spaces or elem.tag == 'body'
+        stack.extend((child_elem, strip_spaces_child, False)
+                     for child_elem in reversed(elem))
+
+  @classmethod
+  def __PostProcessElement(cls, elem: _Element, *, strip_spaces: bool) -> None:
+    """Finalizes an element: strips spaces, processes "delete if empty".
 
+    Does not recurse in children.
+    """
     # Strip spaces.
     if strip_spaces:
       if len(elem):
@@ -699,13 +746,14 @@ class HtmlBranch(Branch['HtmlBranch']):
                                     text_elem=parent_elem)
 
     # Append the placeholder tail to the last child or the before element.
-    if len(elem):
-      previous_elem = elem[-1]
+    children = list(elem)
+    if children:
+      previous_elem = children[-1]
     cls._AppendTextToXml(elem.tail, tail_elem=previous_elem,
                                     text_elem=parent_elem)
 
     # Replace the placeholder element with its children.
-    for child in elem:
+    for child in children:
       elem.addprevious(child)
     del elem[:]
     elem.text = elem.tail = None
@@ -716,6 +764,60 @@ class HtmlBranch(Branch['HtmlBranch']):
       parent_elem.text = GetTagEmptyContents(parent_elem.tag)
 
 
+# The RegisterTargetAction predicates of the targets that do not depend on the
+# state of the branch, keyed by target.
+_STATIC_TARGET_PREDICATES: dict[
+    str, Callable[[HtmlBranch.ElementInfo], bool]] = {
+    # Current element, possibly automatically created.
+    'current': lambda elem_info: True,
+    # Current automatically created element, fails if none.
+    'auto': lambda elem_info: elem_info.level.is_auto,
+    # First non-automatically created ancestor element.
+    'nonauto': lambda elem_info: not elem_info.level.is_auto,
+    # Deepest paragraph element.
+    'para': lambda elem_info: elem_info.level.is_para,
+}
+
+
+class _DecodingWriter:
+  """Binary writer that decodes its input and forwards it to a text writer.
+
+  Decodes incrementally: tolerates characters split across chunks.
+  """
+
+  def __init__(self, writer: TextIO):
+    self.__writer = writer
+    self.__decoder = codecs.getincrementaldecoder(ENCODING)()
+
+  def write(self, data: bytes) -> None:
+    self.__writer.write(self.__decoder.decode(data))
+
+  def Finish(self) -> None:
+    """Flushes the pending bytes; fails if they are not a complete character."""
+    self.__writer.write(self.__decoder.decode(b'', final=True))
+
+
+def _WriteXmlTree(tree: etree._ElementTree, writer: TextIO) -> None:
+  """Serializes an XML tree to a text writer, in small chunks.
+
+  Same output as writer.write(etree.tostring(tree, encoding=str)), without
+  building the whole serialization in memory. The text writer performs its own
+  encoding and newline translation, as for any other text.
+
+  Args:
+    tree: The tree to serialize. Must have no document type and no siblings
+      around its root element: etree.xmlfile can only serialize elements.
+    writer: The text writer to serialize to.
+  """
+  root_elem = tree.getroot()
+  assert (not tree.docinfo.doctype and root_elem.getprevious() is None and
+          root_elem.getnext() is None), 'tree not serializable as an element'
+  decoding_writer = _DecodingWriter(writer)
+  with etree.xmlfile(decoding_writer, encoding=ENCODING) as xml_writer:
+    xml_writer.write(root_elem)
+  decoding_writer.Finish()
+
+
 class Typography(ABC):
 
   name: ClassVar[str]
@@ -754,9 +856,14 @@ class Typography(ABC):
       sign = '–'
     text = sign
 
+    # Split the integer part in groups of 3 digits from the right,
+    # starting with a possibly shorter group on the left.
+    before_len = len(before_decimal)
+    first_group_end = before_len % 3 or 3
     text += thousands_sep.join(
-        reversed([before_decimal[max(0, group_end-3):group_end]
-                  for group_end in range(len(before_decimal), 0, -3)]))
+        [before_decimal[:first_group_end]] +
+        [before_decimal[group_start:group_start+3]
+         for group_start in range(first_group_end, before_len, 3)])
 
     if decimal_sep:
       text += decimal_sep
@@ -779,7 +886,14 @@ class NeutralTypography(Typography):
     return number
 
 
-class EnglishTypography(Typography):
+class _CurlyQuotesTypography(Typography):
+  """Base class of the typography rules that use curly quotes."""
+
+  TextBacktick = AppendTextMacro('text.backtick', "‘")
+  TextApostrophe = AppendTextMacro('text.apostrophe', "’")
+
+
+class EnglishTypography(_CurlyQuotesTypography):
   """English-specific typography rules."""
 
   name = 'english'
@@ -789,11 +903,8 @@ class EnglishTypography(Typography):
   def FormatNumber(number: str) -> str:
     return Typography.FormatNumberCustom(number, thousands_sep=',')
 
-  TextBacktick = AppendTextMacro('text.backtick', "‘")
-  TextApostrophe = AppendTextMacro('text.apostrophe', "’")
 
-
-class FrenchTypography(Typography):
+class FrenchTypography(_CurlyQuotesTypography):
   """French-specific typography rules."""
 
   name = 'french'
@@ -803,9 +914,6 @@ class FrenchTypography(Typography):
   def FormatNumber(number: str) -> str:
     return Typography.FormatNumberCustom(number, thousands_sep=NBSP_THIN)
 
-  TextBacktick = AppendTextMacro('text.backtick', "‘")
-  TextApostrophe = AppendTextMacro('text.apostrophe', "’")
-
   @staticmethod
   @macro(public_name='text.guillemet.open')
   def TextGuillemetOpen(executor: Executor, _: CallNode) -> None:
@@ -844,7 +952,6 @@ class Macros:
 
   __AUTO_PARA_LEVEL_REGEXP = (
       re.compile(r'\Ablock,autopara=(?P<auto_para_tag>.+)\Z'))
-  __CLASS_NAME_SEPARATOR_REGEXP = re.compile(r'\s+')
 
   @staticmethod
   @macro(public_name='par')
@@ -872,7 +979,7 @@ class Macros:
     if autoparablock_match:
       level = TagLevel.BLOCK
       auto_para_tag = autoparablock_match.group('auto_para_tag')
-      if auto_para_tag in _VOID_TAGS_TO_NONE:
+      if auto_para_tag in _VOID_TAGS:
         raise executor.MacroFatalError(
             call_node, f'cannot use void tag as autopara: <{auto_para_tag}>')
     else:
@@ -925,8 +1032,8 @@ class Macros:
     Args:
       target: The element to configure.
     """
-    Macros.__TagAttrSet(executor, call_node, target,
-                        _DELETE_IF_EMPTY_ATTR_NAME, _DELETE_IF_EMPTY_ATTR_VALUE)
+    branch: HtmlBranch = executor.current_branch  # type: ignore[assignment]
+    branch.RegisterTargetAction(call_node, target, _MarkDeleteIfEmpty)
 
   @staticmethod
   @macro(public_name='tag.attr.set', args_signature='target,attr_name,value')
@@ -944,7 +1051,7 @@ class Macros:
   @staticmethod
   def __TagAttrSet(executor: Executor, call_node: CallNode,
                    target: str, attr_name: str, value: str) -> None:
-    if not attr_name.strip():
+    if not attr_name or attr_name.isspace():
       raise executor.MacroFatalError(call_node,
                                      'attribute name cannot be empty')
 
@@ -965,7 +1072,7 @@ class Macros:
       class_name: The name of the CSS class; does nothing if empty.
     """
     branch: HtmlBranch = executor.current_branch  # type: ignore[assignment]
-    class_names = Macros._ParseClassNames(class_name)
+    class_names = dict.fromkeys(Macros._ParseClassNames(class_name))
 
     def Action(elem: _Element) -> None:
       if not class_names:
@@ -973,10 +1080,10 @@ class Macros:
 
       # Append the class name to the 'class' attribute.
       # Preserve ordering (meaningful in CSS).
-      final_class_names = Macros._ParseClassNames(elem.get('class', ''))
-      for class_name in class_names:
-        if class_name not in final_class_names:
-          final_class_names.append(class_name)
+      # Use a dict as ordered set for constant-time deduplication.
+      final_class_names = dict.fromkeys(
+          Macros._ParseClassNames(elem.get('class', '')))
+      final_class_names.update(class_names)
       elem.set('class', ' '.join(final_class_names))
 
     branch.RegisterTargetAction(call_node, target, Action)
@@ -1014,7 +1121,9 @@ class Macros:
     root: HtmlBranch = branch.root  # type: ignore[assignment]
 
     # Reject invalid values.
-    if _NUMBER_REGEXP.match(number) is None:
+    # Fast path: skip the regexp for unsigned integers, the most common case.
+    if (not (number.isascii() and number.isdigit()) and
+        _NUMBER_REGEXP.match(number) is None):
       raise executor.MacroFatalError(call_node, f'invalid integer: {number}')
     executor.AppendText(root.typography.FormatNumber(number))
 
@@ -1032,7 +1141,7 @@ class Macros:
     branch: HtmlBranch = executor.current_branch  # type: ignore[assignment]
     branch.AppendNewline()
 
-  @classmethod
-  def _ParseClassNames(cls, class_names: str) -> list[str]:
-    return [cn for cn in cls.__CLASS_NAME_SEPARATOR_REGEXP.split(class_names)
-            if cn]
+  @staticmethod
+  def _ParseClassNames(class_names: str) -> list[str]:
+    # str.split() splits on whitespace runs and drops empty names.
+    return class_names.split()
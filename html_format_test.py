@@ -4,6 +4,9 @@
 
 __author__ = 'Guillaume Ryder'
 
+import io
+import sys
+
 from lxml import etree
 
 import html_format
@@ -49,8 +52,8 @@ def MakeExpectedXmlString(expected_body, *,
 class AppendTextToXmlTest(testutils.TestCase):
 
   def check(self, text, initial_xml_string, expected_xml_string):
-    initial_xml_string = '<root>' + initial_xml_string + '</root>'
-    expected_xml_string = '<root>' + expected_xml_string + '</root>'
+    initial_xml_string = f'<root>{initial_xml_string}</root>'
+    expected_xml_string = f'<root>{expected_xml_string}</root>'
     tree = ParseXml(initial_xml_string)
     html_format.HtmlBranch._AppendTextToXml(text,
                                             tail_elem=tree.find('.//tail'),
@@ -115,6 +118,33 @@ class InlineXmlElementTest(testutils.TestCase):
       self.check('<root><inline attr="value">inside</inline></root>', '')
 
 
+class WriteXmlTreeTest(testutils.TestCase):
+
+  def assertSameAsToString(self, tree):
+    writer = io.StringIO()
+    html_format._WriteXmlTree(tree, writer)
+    self.assertTextEqual(writer.getvalue(), XmlToString(tree))
+
+  def testSimple(self):
+    self.assertSameAsToString(ParseXml('<root>test</root>'))
+
+  def testFullDocument(self):
+    self.assertSameAsToString(ParseXml(MakeExpectedXmlString(
+        '<p>one " \' &amp; &lt;tag&gt; &#160;' + testutils.TEST_UNICODE +
+        '</p>\n<div><span class="a">two</span><br/></div>\n' +
+        '<!-- comment --><p>three</p>')))
+
+  def testLongUnicodeText_splitAcrossChunks(self):
+    # Serialized in chunks of a few KiB: some split multi-byte characters.
+    text = testutils.TEST_UNICODE * 2000
+    self.assertSameAsToString(ParseXml(f'<root>{text}</root>'))
+
+  def testDoctype_fails(self):
+    tree = ParseXml('<!DOCTYPE root><root/>')
+    with self.assertRaises(AssertionError):
+      html_format._WriteXmlTree(tree, io.StringIO())
+
+
 class HtmlBranchTest(testutils.BranchTestCase):
 
   def setUp(self):
@@ -166,6 +196,26 @@ class HtmlBranchTest(testutils.BranchTestCase):
     self.branch.AppendText('test')
     self.assertRender('<p>test</p>')
 
+  def testRender_translatesNewlines(self):
+    self.branch.AppendText('test')
+    output = io.BytesIO()
+    writer = io.TextIOWrapper(output, encoding='utf-8', newline='\r\n')
+    self.branch._Render(writer)
+    writer.flush()
+    self.assertTextEqual(
+        output.getvalue().decode('utf-8'),
+        MakeExpectedXmlString('<p>test</p>').replace('\n', '\r\n'))
+
+  def testRender_deepNesting(self):
+    depth = sys.getrecursionlimit() + 10
+    for _ in range(depth):
+      self.branch.OpenTag('span', html_format.TagLevel.INLINE)
+    self.branch.AppendText('test')
+    for _ in range(depth):
+      self.branch.CloseTag('span')
+    self.assertRender('<p>' + '<span>' * depth + 'test' + '</span>' * depth +
+                      '</p>')
+
   def testAppendText_trimsSpaces(self):
     self.branch.AppendText('   a   ')
     self.branch.AppendText('  b  ')
@@ -889,6 +939,19 @@ class SimpleMacrosTest(HtmlExecutionTestCase):
             '<p>two neutral?</p>',
         ))
 
+  def testTypo_inheritance_parentChangedAfterResolution(self):
+    self.assertExecution(
+        (
+            '$branch.create.sub[one]',
+            '$branch.write[one][$branch.create.sub[two]]',
+            '$branch.write[two][before $typo.name?]',
+            '$typo.set[french]',
+            '$branch.append[one]',
+            '$branch.write[one][$branch.append[two]]',
+            '$branch.write[two][, after $typo.name?]',
+        ),
+        '<p>before neutral?, after french\u202f?</p>')
+
   def testTypoNumber_invalid(self):
     self.assertExecution(
         '$typo.number[invalid]',
@@ -899,6 +962,9 @@ class SimpleMacrosTest(HtmlExecutionTestCase):
     self.assertExecution(
         '$typo.number[--3]',
         messages=['/root:1: $typo.number: invalid integer: \u20133'])
+    self.assertExecution(
+        '$typo.number[\u0661\u0662]',
+        messages=['/root:1: $typo.number: invalid integer: \u0661\u0662'])
 
 
 class TagOpenCloseTest(HtmlExecutionTestCase):
@@ -1923,6 +1989,21 @@ class TagClassAddTest(HtmlExecutionTestCase):
         '$tag.class.add[invalid][first]',
         messages=['/root:1: $tag.class.add: invalid target: invalid'])
 
+  def testEmptyClassName(self):
+    self.assertExecution(
+        (
+            '$tag.open[span][inline]',
+              '$tag.class.add[<span>][ \n ]',
+              'inside',
+            '$tag.close[span]',
+        ),
+        '<p><span>inside</span></p>')
+
+  def testEmptyClassName_invalidTarget(self):
+    self.assertExecution(
+        '$tag.class.add[invalid][]',
+        messages=['/root:1: $tag.class.add: invalid target: invalid'])
+
 
 if __name__ == '__main__':
   testutils.unittest.main()
@@ -187,7 +187,8 @@ def GetPublicMacros(container: Any) -> MacrosT:
   """
   Returns the public macros declared by a module or class.
 
-  Caches the result in the object.
+  Caches the result in the object itself, not in its classes: subclasses get
+  their own cache.
 
   Args:
     container: The module or class that declares the macros
@@ -195,7 +196,7 @@ def GetPublicMacros(container: Any) -> MacrosT:
   Returns:
     The public macros, keyed by name.
   """
-  if not hasattr(container, 'public_macros'):
+  if 'public_macros' not in vars(container):
     public_macros: MacrosT = {}
     for _, symbol in inspect.getmembers(container):
       public_name = getattr(symbol, 'public_name', None)
@@ -192,6 +192,19 @@ def PublicMacro2():
                      dict(public1=getattr(module, 'PublicMacro1'),
                           public2=getattr(module, 'PublicMacro2')))
 
+  def testOnSubclass(self):
+    class TestSubclass(self.TestClass):
+      @staticmethod
+      @macro(public_name='public3')
+      def PublicMacro3():
+        raise NotImplementedError
+
+    macros.GetPublicMacros(self.TestClass)
+    self.assertEqual(macros.GetPublicMacros(TestSubclass),
+                     dict(public1=self.TestClass.PublicMacro1,
+                          public2=self.TestClass.PublicMacro2,
+                          public3=TestSubclass.PublicMacro3))
+
   def testMultipleCalls(self):
     self.assertEqual(macros.GetPublicMacros(self.TestClass),
                      macros.GetPublicMacros(self.TestClass))
@@ -5,7 +5,7 @@ from __future__ import annotations
 
 __author__ = 'Guillaume Ryder'
 
-from abc import ABC, abstractmethod
+from abc import ABC
 import collections
 from collections.abc import Callable, Iterable, Iterator, Sequence
 from dataclasses import dataclass
@@ -13,13 +13,12 @@ import enum
 import inspect
 import itertools
 import re
-from typing import Any, Generic, NoReturn, Protocol, \
+from typing import Any, ClassVar, Generic, NoReturn, Protocol, \
   TextIO, TYPE_CHECKING, TypeVar
 
 from log import Filename, Location
 
 if TYPE_CHECKING:
-  from execution import Executor
   from log import FatalError, Logger
 
 
@@ -41,6 +40,12 @@ class TokenType(enum.Enum):
   MACRO = enum.auto()     # value: macro name without '$' prefix
 
 
+class NodeKind(enum.IntEnum):
+  """The node types, in the order of the Executor.ExecuteNodes handlers."""
+  TEXT = 0
+  CALL = 1
+
+
 @dataclass
 class Token:
   """Token generated by Lexer."""
@@ -58,9 +63,7 @@ class Node(ABC):
 
   location: Location
 
-  @abstractmethod
-  def Execute(self, executor: Executor) -> None:
-    raise NotImplementedError
+  kind: ClassVar[NodeKind]
 
 
 NodesT = Sequence[Node]
@@ -70,12 +73,11 @@ NodesT = Sequence[Node]
 class TextNode(Node):
   """Plain text node; may contain line breaks."""
 
+  kind: ClassVar[NodeKind] = NodeKind.TEXT
+
   location: Location
   text: str
 
-  def Execute(self, executor: Executor) -> None:
-    executor.AppendText(self.text)
-
   def __str__(self) -> str:
     return repr(self.text)
 
@@ -87,13 +89,12 @@ class TextNode(Node):
 class CallNode(Node):
   """Macro call node."""
 
+  kind: ClassVar[NodeKind] = NodeKind.CALL
+
   location: Location
   name: str  # The name of the macro called, without '$' prefix.
   args: Sequence[NodesT]  # The macro arguments.
 
-  def Execute(self, executor: Executor) -> None:
-    executor.CallMacro(self)
-
   def __str__(self) -> str:
     args = ''.join(f'[{FormatNodes(param)}]' for param in self.args)
     return f'${self.name}{args}'
@@ -314,9 +315,9 @@ class Lexer:
             # Same line: append the text token to the accumulator.
             text_token_accu.value += token.value
             continue
+          # Different line: flush the accumulator, start a new one.
           yield text_token_accu
-          text_token_accu = None
-          yield token
+          text_token_accu = token
       else:
         # Not a text token: flush the text accumulator (if any) then the token.
         if text_token_accu is not None:
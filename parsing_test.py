@@ -332,8 +332,7 @@ class ParsingTest(testutils.TestCase):
             TextNode(loc('root', 3), '\\'),
             CallNode(loc('root', 3), 'text.percent', []),
             TextNode(loc('root', 3), '\n'),
-            TextNode(loc('root', 5), '\\'),
-            TextNode(loc('root', 5), '%'),
+            TextNode(loc('root', 5), '\\%'),
         ])
 
   def testPreProcessing_unknownInstruction(self):
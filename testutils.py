@@ -4,7 +4,7 @@
 __author__ = 'Guillaume Ryder'
 
 import argparse
-import collections
+from collections.abc import Iterable, Mapping
 import errno
 import io
 import os
@@ -153,7 +153,7 @@ class FakeLogger(log.Logger):
   """
   Records logged entries in a string buffer.
 
-  Example output: GetOutput() == 'file.txt:42: some error'
+  Example output: ConsumeStdErr() == 'file.txt:42: some error'
   """
 
   FORMAT = log.LoggerFormat(
@@ -346,9 +346,11 @@ class ExecutionTestCase(TestCase):
   def IdentityMacro(executor, unused_call_node, contents):
     executor.ExecuteNodes(contents)
 
-  def setUp(self):
-    super().setUp()
-    self.additional_builtin_macros = macros.GetPublicMacros(self)
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    # Inspect the test case members once per class rather than once per test.
+    cls.additional_builtin_macros = macros.GetPublicMacros(cls)
 
   @staticmethod
   def GetBranchFilename(branch_name):
@@ -370,7 +372,7 @@ class ExecutionTestCase(TestCase):
     return executor.system_branch
 
   def PrepareInputOutput(self, text_or_iter, separator):
-    if (isinstance(text_or_iter, collections.abc.Iterable) and
+    if (isinstance(text_or_iter, Iterable) and
         not isinstance(text_or_iter, str)):
       return separator.join(text_or_iter)
     else:
@@ -412,7 +414,7 @@ class ExecutionTestCase(TestCase):
       fatal_error = bool(messages)
 
     # Create the input dictionary.
-    if not isinstance(inputs, collections.abc.Mapping):
+    if not isinstance(inputs, Mapping):
       inputs = {'/root': inputs}
     inputs = {
         filename: self.InputHook(
@@ -433,7 +435,7 @@ class ExecutionTestCase(TestCase):
     output_branch.context.AddMacros(self.additional_builtin_macros)
 
     # Create the expected output dictionary.
-    if not isinstance(expected_outputs, collections.abc.Mapping):
+    if not isinstance(expected_outputs, Mapping):
       expected_outputs = {
           self.GetBranchFilename(output_branch.name): expected_outputs,
       }